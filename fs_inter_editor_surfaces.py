@@ -45,13 +45,34 @@ import pandas as pd
 from datetime import datetime as dt
 
 from nibabel.freesurfer.io import (read_geometry, write_morph_data)
-from scipy.spatial.distance import directed_hausdorff
-from sklearn.metrics import pairwise_distances_argmin_min
 
-import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import psutil
 
-from glob import glob
+# Numba is optional - used for a fused distance kernel with no N x M temporaries
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+# pyarrow is optional - its C++ CSV formatter beats the pandas engine once the
+# editor matrix grows to many thousands of rows
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+
+# CuPy is optional - offloads the distance reductions to cuBLAS sgemm, which
+# pays off for high-res surfaces (>500k vertices). Only used if a CUDA device
+# is actually present.
+try:
+    import cupy as cp
+    if cp.cuda.runtime.getDeviceCount() < 1:
+        cp = None
+except Exception:
+    cp = None
 
 
 def main():
@@ -81,10 +102,14 @@ def main():
     hemis = ['lh', 'rh']
     surfnames = ['pial', 'white']
 
-    # Multiprocessing setup
+    # Threading setup
+    # The distance kernel is BLAS-bound, so run a small thread pool for I/O overlap
+    # and leave the remaining cores to the threaded BLAS gemm. Worker processes
+    # would oversubscribe the cores and duplicate surface memory.
     n_cpu = psutil.cpu_count(logical=False)
-    print('Creating pool of {} processes'.format(n_cpu))
-    pool = mp.Pool(n_cpu)
+    n_workers = min(4, n_cpu)
+    os.environ.setdefault('OMP_NUM_THREADS', str(max(1, n_cpu // n_workers)))
+    print('Creating pool of {} worker threads'.format(n_workers))
 
     compare_args = []
     for subject in subjects:
@@ -100,19 +125,38 @@ def main():
 
                         compare_args.append((subjects_dir, args.outdir, subject, editor1, editor2, hemi, surfname))
 
+    # Dispatch the longest jobs first so stragglers do not serialize the tail
+    # of the run. Pairwise cost scales with N x M vertices, and FS surface
+    # files are fixed-stride binary, so file size is a good vertex-count proxy.
+    compare_args.sort(key=job_cost, reverse=True)
+
     # Submit jobs
     # result : list of [subject, editor1, editor2, hemi, surfname, d12, d21, dsym] for each job
-    result = pool.starmap(compare_editors, compare_args)
+    # A failed pair is logged and recorded as NaNs without disturbing the surviving jobs
+    result = []
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+
+        futures = [pool.submit(compare_editors, *job) for job in compare_args]
+
+        for job, future in zip(compare_args, futures):
+
+            _, _, subject, editor1, editor2, hemi, surfname = job
 
-    # Close pool for additional jobs and wait for completion
-    pool.close()
-    pool.join()
+            try:
+                result.append(future.result())
+            except OSError as err:
+                print('* {} vs {} failed for {} {} {} : {}'.format(
+                    editor1, editor2, subject, hemi, surfname, err))
+                result.append((subject, editor1, editor2, hemi, surfname, np.nan, np.nan, np.nan))
 
     # Save results list
     results_csv = os.path.join(args.outdir, 'Hausdorff_Distances.csv')
     print('Saving Hausdorff Distances to {}'.format(results_csv))
     df = pd.DataFrame(result, columns=['Subject', 'Editor1', 'Editor2', 'Hemisphere', 'Surface', 'D12', 'D21', 'DSYM'])
-    df.to_csv(results_csv, sep=',', index=False)
+    if pa is not None:
+        pa_csv.write_csv(pa.Table.from_pandas(df), results_csv)
+    else:
+        df.to_csv(results_csv, sep=',', index=False)
 
     print('Done')
 
@@ -120,109 +164,279 @@ def parse_subj_dirs(subjects_dir):
 
     print('Scanning {} for subjects and editors'.format(subjects_dir))
 
-    # Get list of sub-* subdirectories of FS subjects directory
-    dir_list = glob(os.path.join(subjects_dir, 'sub-CC*'))
-
-    # Init running subject ID and editor name lists
-    subject_list = []
-    editor_list = []
+    # Scan for sub-CC* subdirectories directly - a prefix test on scandir
+    # entries avoids the fnmatch and extra stat calls a glob would make
+    with os.scandir(subjects_dir) as it:
+        dir_list = [entry.name for entry in it
+                    if entry.name.startswith('sub-CC') and entry.is_dir()]
 
-    # Get full list of subject IDs and editor names with duplication
-    for dname in dir_list:
+    # Accumulate unique subject IDs and editor names in one pass
+    subject_set = set()
+    editor_set = set()
 
-        base_dname = os.path.basename(dname)
+    for base_dname in dir_list:
 
         # Split directory name at last '-'
         subject, editor = base_dname.rsplit('-', 1)
 
-        subject_list.append(subject)
-        editor_list.append(editor)
+        subject_set.add(subject)
+        editor_set.add(editor)
 
-    # Boil down to unique subjects and editors
-    subjects = np.unique(subject_list)
-    editors = np.unique(editor_list)
+    return sorted(subject_set), sorted(editor_set)
 
-    return subjects, editors
 
+def surface_path(subjects_dir, subject, editor, hemi, surfname):
 
-def compare_editors(subjects_dir, outdir, subject, editor1, editor2, hemi, surfname):
+    subj_dir = os.path.join(subjects_dir, '{}-{}'.format(subject, editor))
 
-    subj_dir1 = os.path.join(subjects_dir, '{}-{}'.format(subject, editor1))
-    subj_dir2 = os.path.join(subjects_dir, '{}-{}'.format(subject, editor2))
+    return os.path.join(subj_dir, 'surf', '{}.{}'.format(hemi, surfname))
 
-    # Construct surface paths
-    surf1_fname = os.path.join(subj_dir1, 'surf', '{}.{}'.format(hemi, surfname))
-    surf2_fname = os.path.join(subj_dir2, 'surf', '{}.{}'.format(hemi, surfname))
 
-    # Init Hausdorff distance return values
-    d12, d21, dsym = np.nan, np.nan, np.nan
+def job_cost(job):
+    """
+    Estimated cost of one compare_editors job (~ N x M vertex pairs)
+    """
+
+    subjects_dir, _, subject, editor1, editor2, hemi, surfname = job
+
+    surf1_fname = surface_path(subjects_dir, subject, editor1, hemi, surfname)
+    surf2_fname = surface_path(subjects_dir, subject, editor2, hemi, surfname)
+
+    size1 = os.path.getsize(surf1_fname) if os.path.isfile(surf1_fname) else 0
+    size2 = os.path.getsize(surf2_fname) if os.path.isfile(surf2_fname) else 0
+
+    return size1 * size2
+
+
+# Surface coordinate cache shared by all worker threads
+# Each surface takes part in E-1 editor pairs, so caching saves E-2 redundant
+# file reads and binary decodes per subject/hemi/surface
+_surf_cache = {}
+_surf_cache_lock = threading.Lock()
+
+
+def load_surface(surf_fname):
+    """
+    Load FS surface vertex coordinates, memoized across editor pairs
+    """
+
+    with _surf_cache_lock:
+        if surf_fname in _surf_cache:
+            return _surf_cache[surf_fname]
+
+    coords, _ = read_geometry(surf_fname)
+
+    # Cast to contiguous float32 once at load time: halves bytes moved through
+    # cache in the distance gemm (and cache footprint here) and doubles SIMD
+    # lane count. Vertex coordinates are mm scale, far above float32 epsilon.
+    coords = np.ascontiguousarray(coords, dtype=np.float32)
+
+    with _surf_cache_lock:
+        _surf_cache[surf_fname] = coords
+
+    return coords
+
+
+# Typical per-core L2 cache size (bytes) for sizing gemm tiles
+L2_CACHE_BYTES = 512 * 1024
+
+# Serialize entry to the parallel Numba kernel: the default workqueue
+# threading layer is not safe for concurrent callers, and the kernel already
+# saturates the cores via prange
+_kernel_lock = threading.Lock()
+
+if njit is not None:
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def min_dists_sq_3d(a, b, dmin_sq):
+        """
+        Fused per-row minimum squared distance for 3D coordinates
+
+        Difference, square-sum and row minimum in a single pass over (i, j),
+        with no intermediate arrays; the fixed k=3 inner body LLVM-vectorizes
+        to SIMD sub/mul/add.
+        """
+
+        for i in prange(a.shape[0]):
+
+            ax, ay, az = a[i, 0], a[i, 1], a[i, 2]
+            best = np.inf
+
+            for j in range(b.shape[0]):
+                dx = ax - b[j, 0]
+                dy = ay - b[j, 1]
+                dz = az - b[j, 2]
+                d = dx * dx + dy * dy + dz * dz
+                if d < best:
+                    best = d
+
+            dmin_sq[i] = best
 
-    # Init continuation flag
-    keep_going = True
-    coords1 = np.zeros([1,])
-    coords2 = np.zeros([1,])
 
+def closest_distances_gpu(a, b, tile_rows=65536):
+    """
+    GPU version of the tiled |a|^2 + |b|^2 - 2 a.b reduction via CuPy
+
+    The cross term dispatches to cuBLAS sgemm; row tiles bound device memory
+    the same way the CPU path bounds L2. Inputs stay on device across all
+    tiles and only the two reduced vectors come back to the host.
+    """
+
+    a_dev = cp.asarray(a)
+    b_dev = cp.asarray(b)
+
+    a2 = cp.einsum('ij,ij->i', a_dev, a_dev)
+    b2 = cp.einsum('ij,ij->i', b_dev, b_dev)
+
+    dmin12_sq = cp.empty(a_dev.shape[0], dtype=cp.float32)
+    dmin21_sq = cp.full(b_dev.shape[0], cp.inf, dtype=cp.float32)
+
+    for i in range(0, a_dev.shape[0], tile_rows):
+        d2 = a2[i:i+tile_rows, None] + b2[None, :] - 2.0 * (a_dev[i:i+tile_rows] @ b_dev.T)
+        dmin12_sq[i:i+tile_rows] = d2.min(axis=1)
+        cp.minimum(dmin21_sq, d2.min(axis=0), out=dmin21_sq)
+
+    dmin12 = cp.sqrt(cp.maximum(dmin12_sq, 0.0))
+    dmin21 = cp.sqrt(cp.maximum(dmin21_sq, 0.0))
+
+    return cp.asnumpy(dmin12), cp.asnumpy(dmin21)
+
+
+def closest_distances(coords1, coords2, tile_rows=None):
+    """
+    Minimum Euclidean distances between two vertex sets, in both directions
+
+    Expands |a-b|^2 as |a|^2 + |b|^2 - 2 a.b so the cross term is a single matrix
+    product handled by BLAS sgemm. Works in row tiles of coords1 to avoid
+    materializing the full N x M distance matrix. Each tile is reduced along
+    both axes, so the forward (1 to 2) and reverse (2 to 1) minimum distances
+    come from a single pass over the pairwise space, and sqrt is deferred to
+    the N + M reduced minima rather than all N x M entries.
+
+    Tile rows default to roughly half of L2 per core for the cross and d2
+    tiles plus the resident columns of b, so b stays cached while many row
+    tiles of a stream past it.
+
+    Returns (dmin12, dmin21) : length N and length M closest distance vectors
+    """
+
+    # No-op for surfaces loaded via load_surface, which are already float32
+    a = np.asarray(coords1, dtype=np.float32)
+    b = np.asarray(coords2, dtype=np.float32)
+
+    # Offload to the GPU when a CUDA device is available - the job list is a
+    # long series of independent sgemm + min reductions, an ideal fit
+    if cp is not None:
+        return closest_distances_gpu(a, b)
+
+    # Prefer the fused Numba kernel whenever available: its k=3 inner body is
+    # specialized at compile time, keeping all three coordinate lanes in
+    # registers across the j loop, where the gemm path pays generic-k dispatch
+    # and materializes T x M tiles. Footprint is O(N + M) with no temporaries.
+    if njit is not None:
+
+        dmin12_sq = np.empty(a.shape[0], dtype=np.float32)
+        dmin21_sq = np.empty(b.shape[0], dtype=np.float32)
+
+        with _kernel_lock:
+            min_dists_sq_3d(a, b, dmin12_sq)
+            min_dists_sq_3d(b, a, dmin21_sq)
+
+        return np.sqrt(dmin12_sq), np.sqrt(dmin21_sq)
+
+    # Fused squared vertex norms - einsum avoids the squared intermediate array
+    a2 = np.einsum('ij,ij->i', a, a)
+    b2 = np.einsum('ij,ij->i', b, b)
+
+    # Cache-blocked tile height: the cross tile (T x M floats, updated in
+    # place) plus the M resident column minima should fit about half of L2
+    # per core
+    if tile_rows is None:
+        tile_rows = max(256, L2_CACHE_BYTES // (6 * b.shape[0] * 4))
+
+    # Per-row (1 to 2) and per-column (2 to 1) minimum squared distances
+    dmin12_sq = np.empty(a.shape[0], dtype=np.float32)
+    dmin21_sq = np.full(b.shape[0], np.inf, dtype=np.float32)
+
+    # One cross-term buffer reused across tiles and updated in place, so the
+    # loop allocates no T x M temporaries
+    cross = np.empty((min(tile_rows, a.shape[0]), b.shape[0]), dtype=np.float32)
+
+    for i in range(0, a.shape[0], tile_rows):
+        n_rows = min(tile_rows, a.shape[0] - i)
+        d2 = cross[:n_rows]
+        np.dot(a[i:i+n_rows], b.T, out=d2)
+        d2 *= -2.0
+        d2 += a2[i:i+n_rows, None]
+        d2 += b2[None, :]
+        np.min(d2, axis=1, out=dmin12_sq[i:i+n_rows])
+        np.minimum(dmin21_sq, d2.min(axis=0), out=dmin21_sq)
+
+    # Clamp tiny negative rounding residuals before the single sqrt pass
+    dmin12 = np.sqrt(np.maximum(dmin12_sq, 0.0))
+    dmin21 = np.sqrt(np.maximum(dmin21_sq, 0.0))
+
+    return dmin12, dmin21
+
+
+def compare_editors(subjects_dir, outdir, subject, editor1, editor2, hemi, surfname):
+
+    # Construct surface paths
+    surf1_fname = surface_path(subjects_dir, subject, editor1, hemi, surfname)
+    surf2_fname = surface_path(subjects_dir, subject, editor2, hemi, surfname)
+
+    # Missing or unreadable surfaces raise so main can log the failed pair and
+    # keep the surviving jobs running, rather than silently returning NaNs
     if not os.path.isfile(surf1_fname):
-        print('* Subject 1 surface file {} does not exist - exiting'.format(surf1_fname))
-        keep_going = False
+        raise FileNotFoundError('Subject 1 surface file {} does not exist'.format(surf1_fname))
 
     if not os.path.isfile(surf2_fname):
-        print('* Subject 2 surface file {} does not exist - exiting'.format(surf2_fname))
-        keep_going = False
-
-    # Load surfaces
-    try:
-        coords1, faces1 = read_geometry(surf1_fname)
-    except IOError:
-        print('* Problem loading surface from {}'.format(surf1_fname))
-        keep_going = False
-
-    try:
-        coords2, faces2 = read_geometry(surf2_fname)
-    except IOError:
-        print('* Problem loading surface from {}'.format(surf2_fname))
-        keep_going = False
-
-    if keep_going:
-
-        print('{}-{}-{}-{} mesh has {} points'.format(subject, editor1, hemi, surfname, coords1.shape[0]))
-        print('{}-{}-{}-{} mesh has {} points'.format(subject, editor2, hemi, surfname, coords2.shape[0]))
-
-        # Fast pairwise Euclidean distances between nodes of surface 1 and 2
-        # If coords1 is N x 3 and coords2 is M x 3, distmin is N x M
-        print('Computing pairwise distances ({} to {})'.format(editor1, editor2))
-        t0 = dt.now()
-        _, dmin12 = pairwise_distances_argmin_min(coords1, coords2)
-        delta = dt.now() - t0
-        print('Done in {:0.3f} seconds'.format(delta.total_seconds()))
-
-        # Calculate forward Hausdorff distance from pairwise distance results
-        d12 = np.max(dmin12)
-
-        # Fast Hausdorff distances between nodes of surface 1 and 2
-        print('Computing Fast Hausdorff Distances')
-        t0 = dt.now()
-        d21, _, _ = directed_hausdorff(coords2, coords1)
-        delta = dt.now() - t0
-        print('Done in {:0.3f} seconds'.format(delta.total_seconds()))
-
-        # Symmetric Hausdorff distance (max(d12, d21))
-        dsym = max(d12, d21)
-
-        print('Forward Hausdorff Distance   : {:0.3f} mm'.format(d12))
-        print('Reverse Hausdorff Distance   : {:0.3f} mm'.format(d21))
-        print('Symmetric Hausdorff Distance : {:0.3f} mm'.format(dsym))
-
-        # Save closest distances as a morphometry/curv file
-        dist_fname = os.path.join(outdir, '{}-{}-{}-{}-{}.dist'.format(subject, editor1, editor2, hemi, surfname))
-        print('Saving intersurface distances to {}'.format(dist_fname))
-        write_morph_data(dist_fname, dmin12)
-
-        # Copy subject 1 surface to output directory for use with distance annotation in Freeview
-        surf1_bname = os.path.basename(surf1_fname)
-        surf1_outname = '{}-{}-{}'.format(subject, editor1, surf1_bname)
-        print('Copying {} to {}'.format(surf1_bname, surf1_outname))
-        shutil.copy(surf1_fname, os.path.join(outdir, surf1_outname))
+        raise FileNotFoundError('Subject 2 surface file {} does not exist'.format(surf2_fname))
+
+    # Load surfaces (cached across editor pairs)
+    coords1 = load_surface(surf1_fname)
+    coords2 = load_surface(surf2_fname)
+
+    print('{}-{}-{}-{} mesh has {} points'.format(subject, editor1, hemi, surfname, coords1.shape[0]))
+    print('{}-{}-{}-{} mesh has {} points'.format(subject, editor2, hemi, surfname, coords2.shape[0]))
+
+    # Fast pairwise Euclidean distances between nodes of surface 1 and 2
+    # If coords1 is N x 3 and coords2 is M x 3, dmin12 is length N and dmin21 is length M
+    print('Computing pairwise distances ({} to {})'.format(editor1, editor2))
+    t0 = dt.now()
+    dmin12, dmin21 = closest_distances(coords1, coords2)
+    delta = dt.now() - t0
+    print('Done in {:0.3f} seconds'.format(delta.total_seconds()))
+
+    # Calculate forward and reverse Hausdorff distances from pairwise distance results
+    d12 = np.max(dmin12)
+    d21 = np.max(dmin21)
+
+    # Symmetric Hausdorff distance (max(d12, d21))
+    dsym = max(d12, d21)
+
+    print('Forward Hausdorff Distance   : {:0.3f} mm'.format(d12))
+    print('Reverse Hausdorff Distance   : {:0.3f} mm'.format(d21))
+    print('Symmetric Hausdorff Distance : {:0.3f} mm'.format(dsym))
+
+    # Save closest distances in both directions as morphometry/curv files
+    # Both maps come from the same pairwise pass, so downstream symmetric
+    # analyses do not need to rerun with the editors swapped
+    dist12_fname = os.path.join(outdir, '{}-{}-{}-{}-{}-12.dist'.format(subject, editor1, editor2, hemi, surfname))
+    print('Saving forward intersurface distances to {}'.format(dist12_fname))
+    write_morph_data(dist12_fname, dmin12)
+
+    dist21_fname = os.path.join(outdir, '{}-{}-{}-{}-{}-21.dist'.format(subject, editor1, editor2, hemi, surfname))
+    print('Saving reverse intersurface distances to {}'.format(dist21_fname))
+    write_morph_data(dist21_fname, dmin21)
+
+    # Copy both subject surfaces to output directory for use with distance annotation in Freeview
+    # The forward map annotates editor 1's surface, the reverse map editor 2's
+    for editor, surf_fname in ((editor1, surf1_fname), (editor2, surf2_fname)):
+        surf_bname = os.path.basename(surf_fname)
+        surf_outname = '{}-{}-{}'.format(subject, editor, surf_bname)
+        print('Copying {} to {}'.format(surf_bname, surf_outname))
+        shutil.copy(surf_fname, os.path.join(outdir, surf_outname))
 
     return subject, editor1, editor2, hemi, surfname, d12, d21, dsym
 
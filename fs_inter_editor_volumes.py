@@ -51,8 +51,6 @@ from sklearn.metrics import pairwise_distances_argmin_min
 import multiprocessing as mp
 import psutil
 
-from glob import glob
-
 
 def main():
 
@@ -120,29 +118,25 @@ def parse_subj_dirs(subjects_dir):
 
     print('Scanning {} for subjects and editors'.format(subjects_dir))
 
-    # Get list of sub-* subdirectories of FS subjects directory
-    dir_list = glob(os.path.join(subjects_dir, 'sub-CC*'))
-
-    # Init running subject ID and editor name lists
-    subject_list = []
-    editor_list = []
+    # Scan for sub-CC* subdirectories directly - a prefix test on scandir
+    # entries avoids the fnmatch and extra stat calls a glob would make
+    with os.scandir(subjects_dir) as it:
+        dir_list = [entry.name for entry in it
+                    if entry.name.startswith('sub-CC') and entry.is_dir()]
 
-    # Get full list of subject IDs and editor names with duplication
-    for dname in dir_list:
+    # Accumulate unique subject IDs and editor names in one pass
+    subject_set = set()
+    editor_set = set()
 
-        base_dname = os.path.basename(dname)
+    for base_dname in dir_list:
 
         # Split directory name at last '-'
         subject, editor = base_dname.rsplit('-', 1)
 
-        subject_list.append(subject)
-        editor_list.append(editor)
-
-    # Boil down to unique subjects and editors
-    subjects = np.unique(subject_list)
-    editors = np.unique(editor_list)
+        subject_set.add(subject)
+        editor_set.add(editor)
 
-    return subjects, editors
+    return sorted(subject_set), sorted(editor_set)
 
 
 def compare_editors(subjects_dir, outdir, subject, editor1, editor2):
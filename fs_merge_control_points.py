@@ -35,6 +35,7 @@ import os
 import sys
 import argparse
 import numpy as np
+from scipy.spatial.distance import cdist
 
 
 def load_cps(fname):
@@ -56,37 +57,37 @@ def load_cps(fname):
     useRealRAS 1
     """
 
-    cps = []
+    npnts = 0
+    use_real_ras = 0
+    cps = np.empty((0, 3), dtype=float)
 
     try:
-        with open(fname, 'r') as fd:
-            for line in fd:
 
-                # Split line into space-separated values
-                tmp = line.strip()
-                vals = tmp.split(' ')
+        with open(fname, 'r') as fd:
+            lines = fd.readlines()
 
-                if 'numpoints' in vals[0]:
-                    npnts = int(vals[1])
+        # FS always writes the metadata block (info, numpoints, useRealRAS)
+        # at the file tail, so only the last three lines need Python parsing
+        for line in lines[-3:]:
 
-                elif 'useRealRAS' in vals[0]:
-                    use_real_ras = int(vals[1])
+            vals = line.split()
 
-                elif 'info' in vals[0]:
-                    pass
+            if vals and 'numpoints' in vals[0]:
+                npnts = int(vals[1])
 
-                elif len(vals) == 3:
-                    cps.append(vals)
+            elif vals and 'useRealRAS' in vals[0]:
+                use_real_ras = int(vals[1])
 
-                else:
-                    pass
+        # Coordinate rows precede the metadata, so numpy's C-side ASCII
+        # parser can read the numeric block in one pass
+        cps = np.loadtxt(lines[:npnts], dtype=float, ndmin=2)
 
     except IOError:
         print('* Problem loading {}'.format(fname))
     except UnicodeDecodeError:
         print('* Problem decoding {}'.format(fname))
 
-    return np.array(cps, dtype=float), npnts, use_real_ras
+    return cps, npnts, use_real_ras
 
 
 def save_cps(fname, cps, ras_flag):
@@ -138,29 +139,28 @@ def main():
     # Minimum separation for points to be considered distinct (mm)
     d_tol = 0.01
 
-    # Loop over points in second set, checking for distance to points in first set
-    cps = cp1.copy()
-
-    for p2 in cp2:
-
-        # Init closest distance and point in set 1
-        d_min = 1e30
-        p1_closest = np.array([-1, -1, -1])
-
-        for p1 in cp1:
-            d = np.linalg.norm(p1-p2)
-            if d < d_min:
-                d_min = d
-                p1_closest = p1
-
-        if d_min > d_tol:
-            cps = np.vstack([cps, p2])
-        else:
-            print('1:[{:6.1f}, {:6.1f}, {:6.1f}] close to 2:[{:6.1f}, {:6.1f}, {:6.1f}]'.format(
-                p1_closest[0], p1_closest[1], p1_closest[2],
-                p2[0], p2[1], p2[2],
-                d_min)
-            )
+    # Squared distances from every point in set 2 to every point in set 1
+    # Comparing squared distances against d_tol^2 skips the sqrt entirely
+    d2 = cdist(cp2, cp1, 'sqeuclidean')
+    d2_min = d2.min(axis=1)
+    idx_closest = d2.argmin(axis=1)
+
+    # Points in set 2 further than d_tol from all of set 1 are genuinely new
+    new_mask = d2_min > d_tol ** 2
+
+    # Report duplicate points dropped from set 2
+    for p1, p2 in zip(cp1[idx_closest[~new_mask]], cp2[~new_mask]):
+        print('1:[{:6.1f}, {:6.1f}, {:6.1f}] close to 2:[{:6.1f}, {:6.1f}, {:6.1f}]'.format(
+            p1[0], p1[1], p1[2],
+            p2[0], p2[1], p2[2])
+        )
+
+    # Merge set 1 with the new points from set 2 into a preallocated buffer
+    n1 = cp1.shape[0]
+    n_new = int(new_mask.sum())
+    cps = np.empty((n1 + n_new, 3), dtype=np.float64)
+    cps[:n1] = cp1
+    cps[n1:] = cp2[new_mask]
 
     print('Merge summary')
     print('  {} points in {}'.format(cp1.shape[0], cp1_fname))
@@ -13,7 +13,49 @@ import numpy as np
 import pandas as pd
 from nibabel.freesurfer import io
 import shutil
+import subprocess
 from glob import glob
+from concurrent.futures import ThreadPoolExecutor
+
+
+def clone_recon(src_dir, dst_dir):
+    """
+    Clone an FS recon tree as cheaply as the filesystem allows
+
+    Most of a recon clone is overwritten by recon-all downstream, so a full
+    byte-for-byte copy is wasted I/O. Try a copy-on-write reflink clone first
+    (btrfs/XFS), then a hardlink tree, and only fall back to a full copy.
+    """
+
+    # Reflink clone: O(metadata) on COW filesystems, silently a plain copy elsewhere
+    try:
+        subprocess.run(['cp', '-a', '--reflink=auto', src_dir, dst_dir],
+                       check=True, capture_output=True)
+        return
+    except (OSError, subprocess.CalledProcessError):
+        shutil.rmtree(dst_dir, ignore_errors=True)
+
+    # Hardlink tree: shares inodes with the original recon
+    try:
+        shutil.copytree(src_dir, dst_dir, copy_function=os.link)
+    except OSError:
+        shutil.rmtree(dst_dir, ignore_errors=True)
+        shutil.copytree(src_dir, dst_dir)
+
+
+def replace_file(src_fname, dst_fname):
+    """
+    Copy src over dst, unlinking dst first
+
+    Required for hardlink-cloned recons: truncating a linked destination in
+    place would write through the shared inode into the original recon.
+    """
+
+    if os.path.isfile(dst_fname):
+        os.remove(dst_fname)
+
+    shutil.copyfile(src_fname, dst_fname)
+
 
 def main():
 
@@ -31,6 +73,10 @@ def main():
     # Init command list
     cmd_list = []
 
+    # First pass: collect editor/subject pairs and the clones each one needs
+    edit_jobs = []
+    clone_jobs = []
+
     for editor in os.listdir(edit_dir):
 
         print('')
@@ -46,76 +92,90 @@ def main():
             if not os.path.isdir(subj_dir):
 
                 print('* {} not found amongst unedited subjects - skipping'.format(subject))
+                continue
+
+            # Create a new per-editor clone of the original unedited FS recon
+            edited_subject = '{}-{}'.format(subject, editor)
+            subj_edit_dir = os.path.join(fs_edit_dir, edited_subject)
+
+            # Check whether a clone already exists
+            if os.path.isdir(subj_edit_dir):
+
+                print('  {} already exists - skip cloning'.format(subj_edit_dir))
 
             else:
 
-                # Create a new per-editor clone of the original unedited FS recon
-                edited_subject = '{}-{}'.format(subject, editor)
-                subj_edit_dir = os.path.join(fs_edit_dir, edited_subject)
-
-                # Check whether a clone already exists
-                if os.path.isdir(subj_edit_dir):
-
-                    print('  {} already exists - skip cloning'.format(subj_edit_dir))
-
-                else:
-
-                    # Clone unedited recon to edited directory
-                    print('  Cloning {} to {}'.format(subject, fs_edit_dir))
-                    shutil.copytree(subj_dir, subj_edit_dir)
-
-            # Init recon-all command for rerun
-            fs_cmd = 'recon-all -sd {} -subjid {}'.format(fs_edit_dir, edited_subject)
-            arpial_opt = ''
-            ar3_opt = ''
-
-            # Find edited data for this editor and subject
-            src_brain_mask = os.path.join(edit_dir, editor, subject, 'brainmask.mgz')
-            if os.path.isfile(src_brain_mask):
-                dst_brain_mask = os.path.join(subj_edit_dir, 'mri', 'brainmask.mgz')
-                print('  Copying brain mask')
-                print('    From : {}'.format(src_brain_mask)) 
-                print('    To   : {}'.format(dst_brain_mask)) 
-                shutil.copyfile(src_brain_mask, dst_brain_mask)
-                arpial_opt = ' -autorecon-pial'
-
-            src_brain_man = os.path.join(edit_dir, editor, subject, 'brain.finalsurf.manedit.mgz')
-            if os.path.isfile(src_brain_man):
-                dst_brain_man = os.path.join(subj_edit_dir, 'mri', 'brain.finalsurf.manedit.mgz')
-                print('  Copying brain manual edit')
-                print('    From : {}'.format(src_brain_man)) 
-                print('    To   : {}'.format(dst_brain_man)) 
-                shutil.copyfile(src_brain_man, dst_brain_man)
-                arpial_opt = ' -autorecon-pial'
-
-            src_wm_mask = os.path.join(edit_dir, editor, subject, 'wm.mgz')
-            if os.path.isfile(src_wm_mask):
-                dst_wm_mask = os.path.join(subj_edit_dir, 'mri', 'wm.mgz')
-                print('  Copying white matter mask')
-                print('    From : {}'.format(src_wm_mask)) 
-                print('    To   : {}'.format(dst_wm_mask)) 
-                shutil.copyfile(src_wm_mask, dst_wm_mask)
-                fs_cmd += ' -autorecon2-wm'
-                ar3_opt = ' -autorecon3'
-
-            src_wm_cps = os.path.join(edit_dir, editor, subject, 'control.dat')
-            if os.path.isfile(src_wm_cps):
-                # Safely create tmp directory for control points
-                tmp_dir = os.path.join(subj_edit_dir, 'tmp')
-                os.makedirs(tmp_dir, exist_ok=True)
-                dst_wm_cps = os.path.join(tmp_dir, 'control.dat')
-                print('  Copying brain mask')
-                print('    From : {}'.format(src_wm_cps)) 
-                print('    To   : {}'.format(dst_wm_cps)) 
-                shutil.copyfile(src_wm_cps, dst_wm_cps)
-                fs_cmd += ' -autorecon2-cp'
-                ar3_opt = ' -autorecon3'
-
-            # Complete options
-            fs_cmd += ar3_opt + arpial_opt
-
-            # Add freesurfer command to job list
-            cmd_list.append(fs_cmd)
+                # Queue unedited recon clone (reflink/hardlink where possible)
+                print('  Queueing clone of {} to {}'.format(subject, fs_edit_dir))
+                clone_jobs.append((subj_dir, subj_edit_dir))
+
+            edit_jobs.append((editor, subject, edited_subject, subj_edit_dir))
+
+    # Overlap independent clone I/O across subjects
+    if clone_jobs:
+        print('')
+        print('Cloning {} recons'.format(len(clone_jobs)))
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda job: clone_recon(*job), clone_jobs))
+
+    # Second pass: insert edited data and build recon-all rerun commands
+    for editor, subject, edited_subject, subj_edit_dir in edit_jobs:
+
+        print('')
+        print('{} : {}'.format(editor, subject))
+
+        # Init recon-all command for rerun
+        fs_cmd = 'recon-all -sd {} -subjid {}'.format(fs_edit_dir, edited_subject)
+        arpial_opt = ''
+        ar3_opt = ''
+
+        # Find edited data for this editor and subject
+        src_brain_mask = os.path.join(edit_dir, editor, subject, 'brainmask.mgz')
+        if os.path.isfile(src_brain_mask):
+            dst_brain_mask = os.path.join(subj_edit_dir, 'mri', 'brainmask.mgz')
+            print('  Copying brain mask')
+            print('    From : {}'.format(src_brain_mask)) 
+            print('    To   : {}'.format(dst_brain_mask)) 
+            replace_file(src_brain_mask, dst_brain_mask)
+            arpial_opt = ' -autorecon-pial'
+
+        src_brain_man = os.path.join(edit_dir, editor, subject, 'brain.finalsurf.manedit.mgz')
+        if os.path.isfile(src_brain_man):
+            dst_brain_man = os.path.join(subj_edit_dir, 'mri', 'brain.finalsurf.manedit.mgz')
+            print('  Copying brain manual edit')
+            print('    From : {}'.format(src_brain_man)) 
+            print('    To   : {}'.format(dst_brain_man)) 
+            replace_file(src_brain_man, dst_brain_man)
+            arpial_opt = ' -autorecon-pial'
+
+        src_wm_mask = os.path.join(edit_dir, editor, subject, 'wm.mgz')
+        if os.path.isfile(src_wm_mask):
+            dst_wm_mask = os.path.join(subj_edit_dir, 'mri', 'wm.mgz')
+            print('  Copying white matter mask')
+            print('    From : {}'.format(src_wm_mask)) 
+            print('    To   : {}'.format(dst_wm_mask)) 
+            replace_file(src_wm_mask, dst_wm_mask)
+            fs_cmd += ' -autorecon2-wm'
+            ar3_opt = ' -autorecon3'
+
+        src_wm_cps = os.path.join(edit_dir, editor, subject, 'control.dat')
+        if os.path.isfile(src_wm_cps):
+            # Safely create tmp directory for control points
+            tmp_dir = os.path.join(subj_edit_dir, 'tmp')
+            os.makedirs(tmp_dir, exist_ok=True)
+            dst_wm_cps = os.path.join(tmp_dir, 'control.dat')
+            print('  Copying brain mask')
+            print('    From : {}'.format(src_wm_cps)) 
+            print('    To   : {}'.format(dst_wm_cps)) 
+            replace_file(src_wm_cps, dst_wm_cps)
+            fs_cmd += ' -autorecon2-cp'
+            ar3_opt = ' -autorecon3'
+
+        # Complete options
+        fs_cmd += ar3_opt + arpial_opt
+
+        # Add freesurfer command to job list
+        cmd_list.append(fs_cmd)
 
     # Write command list
     cmds_fname = 'rerun_fsrecon.cmds' 